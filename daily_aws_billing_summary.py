@@ -6,33 +6,101 @@ Filters out services with costs below $10 and sorts by highest to lowest cost
 """
 
 import boto3
-import pandas as pd
+from botocore.config import Config
+import numpy as np
 import os
 import sys
 import json
+import logging
+import time
+import hashlib
+import tempfile
+import heapq
+from array import array
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from dotenv import load_dotenv
 from datetime import datetime, timedelta
 from collections import defaultdict
+from dataclasses import dataclass
+
+try:
+    import orjson
+except ImportError:  # optional, faster JSON encoding/decoding
+    orjson = None
 
 load_dotenv()
 
+log = logging.getLogger(__name__)
+
+def json_dumps(obj):
+    """Serialize obj to UTF-8 JSON bytes, using orjson when available"""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj).encode('utf-8')
+
+def json_loads(data):
+    """Parse JSON bytes, using orjson when available"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+@dataclass
+class ServiceRow:
+    """Per-service summary row; daily holds costs positioned as in the report's date list"""
+    # Declared by hand rather than dataclass(slots=True) to keep Python 3.9 support
+    __slots__ = ('name', 'daily', 'total', 'avg', 'pct')
+    name: str
+    daily: np.ndarray
+    total: float
+    avg: float
+    pct: float
+
 class AWSBillingSummary:
     def __init__(self):
+        client_config = Config(
+            region_name='us-east-1',  # Cost Explorer is only available in us-east-1
+            retries={'mode': 'adaptive', 'max_attempts': 10},
+            max_pool_connections=16,
+            tcp_keepalive=True
+        )
         self.cost_explorer = boto3.client('ce',
             aws_access_key_id=os.getenv('AWS_ACCESS_KEY'),
             aws_secret_access_key=os.getenv('AWS_SECRET_KEY'),
-            region_name='us-east-1'  # Cost Explorer is only available in us-east-1
+            config=client_config
         )
         self.webhook_url = os.getenv('MATTERMOST_AWS_BILLING_INCOMING_WEBHOOK')
+        # Persistent webhook session so repeated posts reuse the TLS connection
+        self._session = requests.Session()
+        self._session.headers.update({'Content-Type': 'application/json', 'Accept-Encoding': 'gzip'})
+        # Only retry connection failures: a re-sent POST after a timeout or 5xx could duplicate the report
+        retry_adapter = HTTPAdapter(max_retries=Retry(
+            total=3,
+            connect=3,
+            read=0,
+            status=0,
+            backoff_factor=0.5
+        ))
+        # Self-hosted Mattermost webhooks may be plain http://
+        self._session.mount('https://', retry_adapter)
+        self._session.mount('http://', retry_adapter)
         self.cost_threshold = 10.0  # Minimum cost to include in report
+        # Local Cost Explorer response cache, enabled with AWS_BILLING_CACHE=1 (for manual/dev runs)
+        self.cache_dir = os.path.expanduser('~/.cache/aws_billing')
+        self.cache_ttl = 3600  # seconds
+        self.cache_format_version = 2  # bump when the cached service_costs format or ingestion changes
         # Holders for aggregated values used during formatting
-        self._other_daily = None  # dict[date] -> cost for services below threshold
+        self._other_daily = None  # array of per-day costs for services below threshold
+        self._daily_totals = None  # array of per-day costs across all services
         self._last_date_list = None
+        self._date_cache = {}  # days -> (start_date, end_date, date_list)
         
         # Service name mappings to shorter/acronym versions
         self.service_name_map = {
             'Amazon Relational Database Service': 'RDS',
+            'Amazon RDS Service': 'RDS',
+            'Amazon RDS': 'RDS',
             'Amazon Elastic Compute Cloud - Compute': 'EC2 Compute',
             'Amazon Elastic Compute Cloud': 'EC2',
             'EC2 - Other': 'EC2 Other',
@@ -61,153 +129,208 @@ class AWSBillingSummary:
         """Convert long service names to shorter versions/acronyms"""
         return self.service_name_map.get(service_name, service_name)
         
+    def _fmt_change(self, change):
+        """Format a percentage change with a trend emoji"""
+        if change > 10:
+            return f"📈+{change:.0f}%"
+        if change < -10:
+            return f"📉{change:.0f}%"
+        if change > 0:
+            return f"↗️+{change:.0f}%"
+        if change < 0:
+            return f"↘️{change:.0f}%"
+        return "➡️0%"
+    
+    def _build_row_template(self, n_days):
+        """Build a str.format_map template for a table row with n_days daily columns"""
+        day_cells = ''.join(f" ${{d{i}:.0f}} |" for i in range(n_days))
+        return "| {name} | ${total:.0f} | ${avg:.0f} |" + day_cells + " {chg} |\n"
+    
+    def _fmt_row(self, template, name, total, avg, daily_costs, change_indicator):
+        """Fill a row template; days without spend render as $0"""
+        values = {'name': name, 'total': total, 'avg': avg, 'chg': change_indicator}
+        values.update({f"d{i}": cost for i, cost in enumerate(daily_costs)})
+        return template.format_map(values)
+        
     def get_date_range(self, days=5):
-        """Get date range for the past N days"""
+        """Get date range for the past N days, plus the list of dates it covers"""
+        if days in self._date_cache:
+            return self._date_cache[days]
+        
         end_date = datetime.now().date()
         start_date = end_date - timedelta(days=days)
-        return start_date.strftime('%Y-%m-%d'), end_date.strftime('%Y-%m-%d')
+        date_list = [(start_date + timedelta(days=i)).strftime('%Y-%m-%d') for i in range(days)]
+        
+        # Cached so every step of a run reports on the same window
+        self._date_cache[days] = (start_date.strftime('%Y-%m-%d'), end_date.strftime('%Y-%m-%d'), date_list)
+        return self._date_cache[days]
+    
+    def _get_cache_path(self, params):
+        """Get the cache file for a Cost Explorer query, or None if caching is disabled"""
+        if os.getenv('AWS_BILLING_CACHE') != '1':
+            return None
+        # The version invalidates old files whenever the cached (post-ingestion) format changes
+        key_source = {'version': self.cache_format_version, 'params': params}
+        key = hashlib.sha256(json.dumps(key_source, sort_keys=True).encode()).hexdigest()
+        return os.path.join(self.cache_dir, f"{key}.json")
+    
+    def _load_cached_costs(self, cache_path, n_days):
+        """Load service costs cached within the last cache_ttl seconds, if any"""
+        if not cache_path or not os.path.exists(cache_path):
+            return None
+        if os.path.getmtime(cache_path) < time.time() - self.cache_ttl:
+            return None
+        
+        try:
+            with open(cache_path, 'rb') as f:
+                cached = json_loads(f.read())
+        except (OSError, ValueError) as e:
+            log.warning(f"Ignoring unreadable cache file {cache_path}: {e}")
+            return None
+        
+        # Anything other than service -> n_days numbers is treated as a cache miss
+        if not isinstance(cached, dict) or not all(
+            isinstance(service, str) and isinstance(costs, list) and len(costs) == n_days
+            and all(isinstance(c, (int, float)) and not isinstance(c, bool) for c in costs)
+            for service, costs in cached.items()
+        ):
+            log.warning(f"Ignoring malformed cache file {cache_path}")
+            return None
+        
+        log.info(f"Using cached Cost Explorer response from {cache_path}")
+        return {service: array('d', costs) for service, costs in cached.items()}
+    
+    def _save_cached_costs(self, cache_path, service_costs):
+        """Write service costs to the cache file (no-op if caching is disabled)"""
+        if not cache_path:
+            return
+        
+        tmp_path = None
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            # Write to a temp file and rename so a concurrent run never reads a partial file
+            with tempfile.NamedTemporaryFile('wb', dir=self.cache_dir, suffix='.tmp', delete=False) as f:
+                tmp_path = f.name
+                f.write(json_dumps({service: costs.tolist() for service, costs in service_costs.items()}))
+            os.replace(tmp_path, cache_path)
+        except OSError as e:
+            log.warning(f"Could not write cache file {cache_path}: {e}")
+            if tmp_path and os.path.exists(tmp_path):
+                os.remove(tmp_path)
     
     def get_aws_costs(self, days=5):
         """Get AWS costs for the past N days, grouped by service"""
-        start_date, end_date = self.get_date_range(days)
+        start_date, end_date, date_list = self.get_date_range(days)
+        date_index = {d: i for i, d in enumerate(date_list)}
+        n_days = len(date_list)
         
-        print(f"Fetching AWS unblended costs from {start_date} to {end_date}")
-        print("Excluding record types: Refund, Credit (to mirror AWS Console)")
+        log.info(f"Fetching AWS unblended costs from {start_date} to {end_date}")
+        log.info("Excluding record types: Refund, Credit (to mirror AWS Console)")
         
         try:
-            # We'll page through results to be safe, though this query typically fits in one page
-            next_token = None
-            service_costs = defaultdict(dict)  # dict of service -> {date: cost}
-            
-            while True:
-                params = {
-                    'TimePeriod': {
-                        'Start': start_date,
-                        'End': end_date
-                    },
-                    'Granularity': 'DAILY',
-                    'Metrics': ['UnblendedCost'],
-                    'GroupBy': [
-                        {'Type': 'DIMENSION', 'Key': 'SERVICE'}
-                    ],
-                    # Match console by excluding credits/refunds
-                    'Filter': {
-                        'Not': {
-                            'Dimensions': {
-                                'Key': 'RECORD_TYPE',
-                                'Values': ['Refund', 'Credit']
-                            }
+            params = {
+                'TimePeriod': {
+                    'Start': start_date,
+                    'End': end_date
+                },
+                'Granularity': 'DAILY',
+                'Metrics': ['UnblendedCost'],
+                'GroupBy': [
+                    {'Type': 'DIMENSION', 'Key': 'SERVICE'}
+                ],
+                # Match console by excluding credits/refunds
+                'Filter': {
+                    'Not': {
+                        'Dimensions': {
+                            'Key': 'RECORD_TYPE',
+                            'Values': ['Refund', 'Credit']
                         }
                     }
                 }
-                if next_token:
-                    params['NextPageToken'] = next_token
-                response = self.cost_explorer.get_cost_and_usage(**params)
-
-                # Process the response to calculate daily costs per service
-                for result in response['ResultsByTime']:
-                    date = result['TimePeriod']['Start']
-                    for group in result['Groups']:
-                        service = group['Keys'][0]
-                        cost = float(group['Metrics']['UnblendedCost']['Amount'])
-                        if cost > 0:
-                            if service not in service_costs:
-                                service_costs[service] = {}
-                            # Sum in case pagination returns split groups (defensive)
-                            service_costs[service][date] = service_costs[service].get(date, 0.0) + cost
+            }
 
-                next_token = response.get('NextPageToken')
-                if not next_token:
-                    break
+            cache_path = self._get_cache_path(params)
+            service_costs = self._load_cached_costs(cache_path, n_days)
+            
+            if service_costs is None:
+                # dict of service -> array of daily costs, positioned as in date_list
+                service_costs = defaultdict(lambda: array('d', [0.0]) * n_days)
+                
+                # Let botocore handle NextPageToken, though this query typically fits in one page
+                paginator = self.cost_explorer.get_paginator('get_cost_and_usage')
+                for page in paginator.paginate(**params):
+                    # Process the response to calculate daily costs per service
+                    for result in page['ResultsByTime']:
+                        i = date_index.get(result['TimePeriod']['Start'])
+                        if i is None:
+                            continue
+                        for group in result['Groups']:
+                            # Shorten at ingestion so aliases of one service share a bucket
+                            service = self.get_short_service_name(group['Keys'][0])
+                            cost = float(group['Metrics']['UnblendedCost']['Amount'])
+                            if cost > 0:
+                                # Sum in case pagination returns split groups (defensive)
+                                service_costs[service][i] += cost
+                
+                self._save_cached_costs(cache_path, service_costs)
 
-            # Debug surface for RDS
-            rds_key_variants = [
-                'Amazon Relational Database Service',
-                'Amazon RDS Service',
-                'Amazon RDS'
-            ]
-            for key in rds_key_variants:
-                if key in service_costs:
-                    total = sum(service_costs[key].values())
-                    print(f"[DEBUG] RDS service '{key}' total for window: ${total:.2f}")
-                    break
+            # Debug surface for RDS (set DEBUG_RDS=1 with LOG_LEVEL=DEBUG)
+            if os.getenv('DEBUG_RDS'):
+                # All RDS name variants are mapped to 'RDS' at ingestion
+                if 'RDS' in service_costs:
+                    total = sum(service_costs['RDS'])
+                    log.debug(f"RDS service 'RDS' total for window: ${total:.2f}")
             
             return service_costs
             
         except Exception as e:
-            print(f"Error fetching AWS costs: {e}")
+            log.error(f"Error fetching AWS costs: {e}")
             return {}
     
+    def _percentage_change(self, daily_costs):
+        """Percentage change per row of a (rows x days) array: last 2 days vs previous 3 days"""
+        if daily_costs.shape[1] < 4:
+            return np.zeros(daily_costs.shape[0])
+        
+        recent_avg = daily_costs[:, -2:].mean(axis=1)
+        previous_avg = daily_costs[:, -5:-2].mean(axis=1)
+        # Rows with no spend in the previous window report 0% change
+        return np.divide(recent_avg - previous_avg, previous_avg,
+                         out=np.zeros_like(previous_avg), where=previous_avg > 0) * 100
+    
     def calculate_service_summaries(self, service_costs, days=5):
         """Calculate service summaries with daily breakdown"""
-        # Get the date range to ensure we have all dates
-        start_date, end_date = self.get_date_range(days)
+        _, _, date_list = self.get_date_range(days)
         
-        # Generate list of all dates in range
-        date_list = []
-        current_date = datetime.strptime(start_date, '%Y-%m-%d').date()
-        end_date_obj = datetime.strptime(end_date, '%Y-%m-%d').date()
+        # Dense services x dates matrix, stacked straight from the per-service arrays
+        names = list(service_costs)
+        if names:
+            matrix = np.vstack([np.frombuffer(service_costs[s], dtype=np.float64) for s in names])
+        else:
+            matrix = np.zeros((0, len(date_list)))
         
-        while current_date < end_date_obj:
-            date_list.append(current_date.strftime('%Y-%m-%d'))
-            current_date += timedelta(days=1)
+        totals = matrix.sum(axis=1)
+        avgs = totals / len(date_list) if date_list else np.zeros(len(names))
         
-        service_summaries = []
-        # Track aggregated daily costs for services below threshold
-        other_daily = {d: 0.0 for d in date_list}
+        pct = self._percentage_change(matrix)
         
-        for service, daily_costs in service_costs.items():
-            if not daily_costs:
-                continue
-            
-            # Create daily breakdown with 0 for missing days
-            daily_breakdown = {}
-            total_cost = 0
-            
-            for date in date_list:
-                cost = daily_costs.get(date, 0.0)
-                daily_breakdown[date] = cost
-                total_cost += cost
-            
-            avg_daily_cost = total_cost / len(date_list) if date_list else 0
-            
-            # Aggregate services below threshold into 'Other costs'
-            if avg_daily_cost < self.cost_threshold:
-                for date in date_list:
-                    other_daily[date] += daily_breakdown[date]
-                continue
-            
-            # Calculate percentage change (compare last 2 days vs previous 3 days)
-            costs_list = [daily_breakdown[date] for date in date_list]
-            if len(costs_list) >= 4:
-                recent_costs = costs_list[-2:]  # Last 2 days
-                previous_costs = costs_list[-5:-2]  # Previous 3 days
-                
-                recent_avg = sum(recent_costs) / len(recent_costs) if recent_costs else 0
-                previous_avg = sum(previous_costs) / len(previous_costs) if previous_costs else 0
-                
-                if previous_avg > 0:
-                    percentage_change = ((recent_avg - previous_avg) / previous_avg) * 100
-                else:
-                    percentage_change = 0
-            else:
-                percentage_change = 0
-            
-            service_summaries.append({
-                'service': service,
-                'original_service': service,
-                'daily_breakdown': daily_breakdown,
-                'total_cost': total_cost,
-                'avg_daily_cost': avg_daily_cost,
-                'percentage_change': percentage_change,
-                'date_list': date_list
-            })
+        # Aggregate services below threshold into 'Other costs'
+        mask = avgs >= self.cost_threshold
+        other_costs = np.zeros(len(date_list))
+        np.add.reduce(matrix[~mask], axis=0, out=other_costs)
         
         # Sort by average daily cost (highest to lowest)
-        service_summaries.sort(key=lambda x: x['avg_daily_cost'], reverse=True)
+        kept = np.flatnonzero(mask)
+        kept = kept[np.argsort(-avgs[kept], kind='stable')]
+        
+        service_summaries = [
+            ServiceRow(names[i], matrix[i], float(totals[i]), float(avgs[i]), float(pct[i]))
+            for i in kept
+        ]
         
         # Save aggregates for formatting later (do not add to list to avoid affecting top N)
-        self._other_daily = other_daily
+        self._other_daily = other_costs
+        self._daily_totals = matrix.sum(axis=0)  # every service, not only the displayed top 10
         self._last_date_list = date_list
 
         return service_summaries
@@ -217,143 +340,67 @@ class AWSBillingSummary:
         if not service_summaries:
             return "No AWS costs found above the $10 threshold for the past 5 days."
         
-        start_date, end_date = self.get_date_range(days)
+        start_date, end_date, date_list = self.get_date_range(days)
         
         # Calculate total costs
-        total_avg_daily = sum(s['avg_daily_cost'] for s in service_summaries)
-        total_period = sum(s['total_cost'] for s in service_summaries)
+        total_avg_daily = sum(s.avg for s in service_summaries)
+        total_period = sum(s.total for s in service_summaries)
         
-        message = f"## 📊 AWS Cost Summary ({start_date} to {end_date})\n\n"
-        message += f"**Total Cost:** ${total_period:.2f} | **Average Daily Cost:** ${total_avg_daily:.2f}\n"
-        message += f"*Showing unblended costs (true usage costs before account-level discounts)*\n\n"
+        parts = [
+            f"## 📊 AWS Cost Summary ({start_date} to {end_date})\n\n",
+            f"**Total Cost:** ${total_period:.2f} | **Average Daily Cost:** ${total_avg_daily:.2f}\n",
+            "*Showing unblended costs (true usage costs before account-level discounts)*\n\n",
+        ]
         
-        # Get date list from first service (they should all have the same dates)
         if service_summaries:
-            date_list = service_summaries[0]['date_list']
-            
-            # Create table header with daily columns
-            header = "| Service | Total | Avg |"
-            separator = "|---------|-------|-----|"
+            # Create table header with daily columns (dates as MM-DD for brevity)
+            parts.append("| Service | Total | Avg |")
+            parts.extend(f" {datetime.strptime(date, '%Y-%m-%d').strftime('%m-%d')} |" for date in date_list)
+            parts.append(" Change |\n")
+            parts.append("|---------|-------|-----|" + "------|" * len(date_list) + "--------|\n")
             
-            for date in date_list:
-                # Format date as MM-DD for brevity
-                date_obj = datetime.strptime(date, '%Y-%m-%d')
-                short_date = date_obj.strftime('%m-%d')
-                header += f" {short_date} |"
-                separator += "------|"
-            
-            header += " Change |\n"
-            separator += "--------|\n"
-            
-            message += header + separator
+            # Every row shares one template with a placeholder per day
+            row_template = self._build_row_template(len(date_list))
             
             # Add table rows (limit to top 10 for readability)
             for service in service_summaries[:10]:
-                service_name = service['service']
-                avg_cost = service['avg_daily_cost']
-                total_cost = service['total_cost']
-                change = service['percentage_change']
-                daily_breakdown = service['daily_breakdown']
-                
-                
-                # Format percentage change with emoji
-                if change > 10:
-                    change_indicator = f"📈+{change:.0f}%"
-                elif change < -10:
-                    change_indicator = f"📉{change:.0f}%"
-                elif change > 0:
-                    change_indicator = f"↗️+{change:.0f}%"
-                elif change < 0:
-                    change_indicator = f"↘️{change:.0f}%"
-                else:
-                    change_indicator = "➡️0%"
-                
-                # Build row with daily costs
-                row = f"| {service_name} | ${total_cost:.0f} | ${avg_cost:.0f} |"
-                
-                for date in date_list:
-                    daily_cost = daily_breakdown[date]
-                    if daily_cost > 0:
-                        row += f" ${daily_cost:.0f} |"
-                    else:
-                        row += " $0 |"
-                
-                row += f" {change_indicator} |\n"
-                message += row
+                parts.append(self._fmt_row(row_template, service.name, service.total, service.avg,
+                                           service.daily.tolist(), self._fmt_change(service.pct)))
 
             # Append 'Other costs' aggregated row (for services below threshold)
-            if self._other_daily and any(v > 0 for v in self._other_daily.values()):
-                other_total = sum(self._other_daily.values())
-                other_avg = other_total / len(self._other_daily) if self._other_daily else 0
-                row = f"| Other costs | ${other_total:.0f} | ${other_avg:.0f} |"
-                for date in date_list:
-                    dc = self._other_daily[date]
-                    row += f" ${dc:.0f} |" if dc > 0 else " $0 |"
-                row += " — |\n"
-                message += row
+            other_daily = self._other_daily
+            if other_daily is not None and (other_daily > 0).any():
+                other_total = other_daily.sum()
+                other_avg = other_total / len(other_daily)
+                parts.append(self._fmt_row(row_template, "Other costs", other_total, other_avg,
+                                           other_daily.tolist(), "—"))
 
             # Separator row (dashes) before daily total to keep within the same table
-            sep = "| — | — | — |" + (" — |" * len(date_list)) + " — |\n"
-            message += sep
+            parts.append("| — | — | — |" + (" — |" * len(date_list)) + " — |\n")
 
             # Append 'Daily Total' row (sum of all services including Other)
-            # Compute per-day totals from shown services plus other_daily
-            daily_totals = {d: 0.0 for d in date_list}
-            # Include all services above threshold (not only displayed top 10)
-            for svc in service_summaries:
-                for d in date_list:
-                    daily_totals[d] += svc['daily_breakdown'][d]
-            if self._other_daily:
-                for d in date_list:
-                    daily_totals[d] += self._other_daily[d]
-            total_all = sum(daily_totals.values())
+            daily_totals = self._daily_totals
+            total_all = daily_totals.sum()
             avg_all = total_all / len(date_list) if date_list else 0
 
             # Compute percentage change for Daily Total (last 2 days vs previous 3)
-            totals_list = [daily_totals[d] for d in date_list]
-            if len(totals_list) >= 4:
-                recent_totals = totals_list[-2:]
-                previous_totals = totals_list[-5:-2]
-                recent_avg = sum(recent_totals) / len(recent_totals) if recent_totals else 0
-                previous_avg = sum(previous_totals) / len(previous_totals) if previous_totals else 0
-                if previous_avg > 0:
-                    total_change = ((recent_avg - previous_avg) / previous_avg) * 100
-                else:
-                    total_change = 0
-            else:
-                total_change = 0
-
-            # Format change indicator consistent with services
-            if total_change > 10:
-                total_change_indicator = f"📈+{total_change:.0f}%"
-            elif total_change < -10:
-                total_change_indicator = f"📉{total_change:.0f}%"
-            elif total_change > 0:
-                total_change_indicator = f"↗️+{total_change:.0f}%"
-            elif total_change < 0:
-                total_change_indicator = f"↘️{total_change:.0f}%"
-            else:
-                total_change_indicator = "➡️0%"
+            total_change = self._percentage_change(daily_totals[np.newaxis, :])[0]
 
-            total_row = f"| Daily Total | ${total_all:.0f} | ${avg_all:.0f} |"
-            for d in date_list:
-                dc = daily_totals[d]
-                total_row += f" ${dc:.0f} |" if dc > 0 else " $0 |"
-            total_row += f" {total_change_indicator} |\n"
-            message += total_row
+            parts.append(self._fmt_row(row_template, "Daily Total", total_all, avg_all,
+                                       daily_totals.tolist(), self._fmt_change(total_change)))
             
             if len(service_summaries) > 10:
                 remaining = len(service_summaries) - 10
-                message += f"\n*... and {remaining} more services above ${self.cost_threshold} threshold*\n"
+                parts.append(f"\n*... and {remaining} more services above ${self.cost_threshold} threshold*\n")
         
-        message += f"\n---\n*Report generated at {datetime.now().strftime('%Y-%m-%d %H:%M:%S')} UTC*"
+        parts.append(f"\n---\n*Report generated at {datetime.now().strftime('%Y-%m-%d %H:%M:%S')} UTC*")
         
-        return message
+        return ''.join(parts)
     
     def send_to_mattermost(self, message):
         """Send message to Mattermost via webhook"""
         if not self.webhook_url:
-            print("ERROR: MATTERMOST_AWS_BILLING_INCOMING_WEBHOOK not set in .env file")
+            log.error("ERROR: MATTERMOST_AWS_BILLING_INCOMING_WEBHOOK not set in .env file")
             return False
         
         payload = {
@@ -363,84 +410,96 @@ class AWSBillingSummary:
         }
         
         try:
-            response = requests.post(self.webhook_url, json=payload)
+            # Content-Type is already set on the session
+            response = self._session.post(self.webhook_url, data=json_dumps(payload), timeout=10)
             response.raise_for_status()
-            print("✅ Successfully sent message to Mattermost")
+            log.info("✅ Successfully sent message to Mattermost")
             return True
         except requests.exceptions.RequestException as e:
-            print(f"❌ Error sending to Mattermost: {e}")
+            log.error(f"❌ Error sending to Mattermost: {e}")
             return False
     
-    def run_daily_summary(self):
-        """Main method to run the daily summary"""
-        print("🚀 Starting AWS Daily Billing Summary")
-        print("=" * 50)
+    def run_daily_summary(self, dry_run=False):
+        """Main method to run the daily summary; dry_run prints the message instead of posting it"""
+        log.info("🚀 Starting AWS Daily Billing Summary")
+        log.info("=" * 50)
         
         # Get AWS costs for the past 5 days
         service_costs = self.get_aws_costs(days=5)
         
         if not service_costs:
-            print("❌ No cost data retrieved")
+            log.error("❌ No cost data retrieved")
             return False
         
-        print(f"📊 Retrieved data for {len(service_costs)} services")
-        
-        # Print summary of top services found
-        service_totals = []
-        for service in service_costs.keys():
-            total_cost = sum(service_costs[service].values())
-            avg_cost = total_cost / len(service_costs[service]) if service_costs[service] else 0
-            service_totals.append((service, total_cost, avg_cost))
+        log.info(f"📊 Retrieved data for {len(service_costs)} services")
         
-        # Sort by total cost and show top 5
-        service_totals.sort(key=lambda x: x[1], reverse=True)
-        print("Top 5 services by usage cost:")
-        for service, total, avg in service_totals[:5]:
+        # Print summary of top 5 services found by total cost
+        top_services = heapq.nlargest(5, ((service, sum(costs)) for service, costs in service_costs.items()),
+                                      key=lambda x: x[1])
+        log.info("Top 5 services by usage cost:")
+        for service, total in top_services:
             if total > 0:
-                print(f"  - {service}: ${avg:.2f}/day")
+                days_with_cost = sum(1 for c in service_costs[service] if c > 0)
+                log.info(f"  - {service}: ${total / days_with_cost:.2f}/day")
         
         # Calculate summaries with daily breakdown
         service_summaries = self.calculate_service_summaries(service_costs)
         
         if not service_summaries:
-            print("❌ No services found above the cost threshold")
+            log.error("❌ No services found above the cost threshold")
             return False
         
-        print(f"📈 {len(service_summaries)} services above ${self.cost_threshold} threshold")
+        log.info(f"📈 {len(service_summaries)} services above ${self.cost_threshold} threshold")
         
         # Format message
         message = self.format_mattermost_message(service_summaries)
         
-        # Print to console for debugging
-        print("\n" + "="*50)
-        print("MESSAGE TO BE SENT:")
-        print("="*50)
-        print(message)
-        print("="*50)
+        if dry_run:
+            print(message)
+            log.info("🧪 Dry run: skipped sending to Mattermost")
+            return True
+        
+        # Dump the full message only when debugging (LOG_LEVEL=DEBUG)
+        if log.isEnabledFor(logging.DEBUG):
+            separator = "=" * 50
+            log.debug(f"\n{separator}\nMESSAGE TO BE SENT:\n{separator}\n{message}\n{separator}")
         
         # Send to Mattermost
         success = self.send_to_mattermost(message)
         
         if success:
-            print("✅ Daily summary completed successfully")
+            log.info("✅ Daily summary completed successfully")
         else:
-            print("❌ Failed to send daily summary")
+            log.error("❌ Failed to send daily summary")
         
         return success
 
 def main():
     """Main function"""
     # Check if this is a manual run
-    manual_run = len(sys.argv) > 1 and sys.argv[1] == '--manual'
+    manual_run = '--manual' in sys.argv
+    # Build and print the message without posting it
+    dry_run = '--dry-run' in sys.argv
+    
+    # Fall back to INFO rather than failing on an unknown LOG_LEVEL
+    log_level_name = os.getenv('LOG_LEVEL', 'INFO').upper()
+    log_level = logging.getLevelName(log_level_name)
+    # getLevelName returns an int for known names and aliases (e.g. WARN), a string otherwise
+    unknown_level = not isinstance(log_level, int)
+    if unknown_level:
+        log_level = logging.INFO
+    logging.basicConfig(level=log_level, format='%(message)s', stream=sys.stdout)
+    if unknown_level:
+        log.warning(f"Unknown LOG_LEVEL '{log_level_name}', using INFO")
     
     if manual_run:
-        print("🔧 Manual trigger activated")
+        log.info("🔧 Manual trigger activated")
     else:
-        print("⏰ Scheduled run activated")
+        log.info("⏰ Scheduled run activated")
     
     # Create and run the billing summary
     billing_summary = AWSBillingSummary()
-    success = billing_summary.run_daily_summary()
+    success = billing_summary.run_daily_summary(dry_run=dry_run)
     
     # Exit with appropriate code
     sys.exit(0 if success else 1)